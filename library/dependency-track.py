@@ -120,6 +120,13 @@ options:
 # extends_documentation_fragment:
 #     - my_namespace.my_collection.my_doc_fragment_name
 
+requirements:
+    - requests
+    - orjson (optional, speeds up parsing the responses of the apiserver)
+
+notes:
+    - All requests advertise gzip/deflate compression, the listings are only compressed if the apiserver supports it (the embedded Jetty of dependency track does).
+
 author:
     - Michael Scheef (@shei99)
 '''
@@ -217,11 +224,50 @@ api_keys:
 
 from ansible.module_utils.basic import AnsibleModule
 import requests
-from collections import defaultdict
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    import orjson
+    HAS_ORJSON = True
+except ImportError:
+    HAS_ORJSON = False
+
+
+# the project tree kept flat: project name -> uuid, uuid -> child uuids and
+# uuid -> parent uuid (None for root projects)
+ProjectIndex = namedtuple('ProjectIndex', ['uuids', 'children', 'parents'])
+
+PERMISSIONS = frozenset(['ACCESS_MANAGEMENT', 'BOM_UPLOAD', 'POLICY_MANAGEMENT', 'POLICY_VIOLATION_ANALYSIS',
+                         'PORTFOLIO_MANAGEMENT', 'PROJECT_CREATION_UPLOAD', 'SYSTEM_CONFIGURATION',
+                         'VIEW_PORTFOLIO', 'VIEW_VULNERABILITY', 'VULNERABILITY_MANAGEMENT'])
 
+# number of workers of every thread pool. the pools are nested, e.g. every
+# team runs its own pool, so more requests than the pool_maxsize of the
+# session adapter can be in flight, the excess waits for a free connection
+MAX_WORKERS = 8
 
-DICT_KEY_CHILDREN = 'children'
-DICT_KEY_ID = 'id'
+# number of projects that are requested per page of the project listing
+PROJECT_PAGE_SIZE = 1000
+
+# seconds to wait for the connection and for a response of the apiserver
+REQUEST_TIMEOUT = 30.0
+
+
+class DependencyTrackError(Exception):
+    pass
+
+
+class TimeoutHTTPAdapter(HTTPAdapter):
+    # requests has no session wide timeout, so it is applied to every request
+    # that does not set one, a stalled connection is then retried instead of
+    # blocking a worker forever
+    def send(self, request, **kwargs):
+        if kwargs.get('timeout') is None:
+            kwargs['timeout'] = REQUEST_TIMEOUT
+        return super().send(request, **kwargs)
 
 
 def run_module():
@@ -240,10 +286,7 @@ def run_module():
     teams_spec = dict(
         name=dict(type='str'),
         oidc_groups=dict(type='list', default=[]),
-        permissions=dict(type='list', default=[],
-                         choices=['ACCESS_MANAGEMENT', 'BOM_UPLOAD', 'POLICY_MANAGEMENT', 'POLICY_VIOLATION_ANALYSIS',
-                                  'PORTFOLIO_MANAGEMENT', 'PROJECT_CREATION_UPLOAD', 'SYSTEM_CONFIGURATION',
-                                  'VIEW_PORTFOLIO', 'VIEW_VULNERABILITY', 'VULNERABILITY_MANAGEMENT']),
+        permissions=dict(type='list', default=[], choices=sorted(PERMISSIONS)),
         portfolio_access_control=dict(type='dict', default={}, options=portfolio_access_control_spec)
     )
 
@@ -291,36 +334,47 @@ def run_module():
     if module.check_mode:
         module.exit_json(**result)
 
-    url = module.params['url']
+    url = module.params['url'].rstrip('/')
     api_key = module.params['api_key']
     oidc_groups = module.params['oidc_groups']
     teams = module.params['teams']
     projects = module.params['projects']
     state = module.params['state']
 
-    if state == 'present':
-        changed = create_oidc_groups(url, api_key, oidc_groups)
-        result['changed'] = result['changed'] or changed
-
-        changed = create_teams(url, api_key, teams)
-        result['changed'] = result['changed'] or changed
-
-        changed = create_projects(url, api_key, projects)
-        result['changed'] = result['changed'] or changed
-
-        result['api_keys'] = get_team_api_keys(url, api_key, teams)
-
-        changed = manage_group_mappings(url, api_key, teams)
-        result['changed'] = result['changed'] or changed
-    else:
-        changed = delete_oidc_groups(url, api_key, oidc_groups)
-        result['changed'] = result['changed'] or changed
-
-        changed = delete_teams(url, api_key, teams)
-        result['changed'] = result['changed'] or changed
-
-        changed = delete_projects(url, api_key, projects)
-        result['changed'] = result['changed'] or changed
+    # one session for the whole run, so every request reuses the pooled
+    # keep-alive connections instead of doing a new tcp/tls handshake
+    session = create_session(api_key)
+    try:
+        # the existing state is read once and kept up to date by the helpers,
+        # instead of being fetched again by every helper that needs it
+        existing_oidc_groups, existing_teams, project_index = run_in_parallel(
+            lambda: get_existing_oidc_groups(session, url),
+            lambda: get_existing_teams(session, url),
+            lambda: get_project_tree(session, url))
+
+        if state == 'present':
+            # groups, teams and projects do not depend on each other, only the
+            # mappings below need all of them
+            collect_changes(result, submit_in_parallel(
+                lambda: create_oidc_groups(session, url, oidc_groups, existing_oidc_groups),
+                lambda: create_teams(session, url, teams, existing_teams),
+                lambda: create_projects(session, url, projects, project_index)))
+
+            result['api_keys'] = get_team_api_keys(teams, existing_teams)
+
+            changed = manage_group_mappings(session, url, teams, existing_teams, existing_oidc_groups, project_index)
+            result['changed'] = result['changed'] or changed
+        else:
+            collect_changes(result, submit_in_parallel(
+                lambda: delete_oidc_groups(session, url, oidc_groups, existing_oidc_groups),
+                lambda: delete_teams(session, url, teams, existing_teams),
+                lambda: delete_projects(session, url, projects, project_index)))
+    # a successful response whose body is no json raises a ValueError from
+    # orjson and from older versions of requests
+    except (DependencyTrackError, requests.RequestException, ValueError) as e:
+        module.fail_json(msg=str(e), **result)
+    finally:
+        session.close()
 
 
     # manipulate or modify the state as needed (this is going to be the
@@ -339,302 +393,401 @@ def run_module():
     module.exit_json(**result)
 
 
-def create_oidc_groups(url: str, api_key: str, oidc_groups: list) -> bool:
-    headers = {'X-API-Key': api_key}
-    changed = False
-    for group in oidc_groups:
+def create_session(api_key: str) -> requests.Session:
+    session = requests.Session()
+    session.headers.update({'X-API-Key': api_key, 'Accept-Encoding': 'gzip, deflate', 'Connection': 'keep-alive'})
+    # retry transient failures on the pooled connection instead of failing
+    # the whole task, which would redo every request on the next run. put and
+    # post are only retried when the connection failed, a failed response may
+    # belong to a create that went through and e.g. teams allow duplicates
+    retry = Retry(total=5, backoff_factor=0.5, status_forcelist=[429, 500, 502, 503, 504],
+                  allowed_methods=frozenset(['GET', 'DELETE']))
+    # block instead of opening throwaway connections when more requests are
+    # in flight than the pool holds, so the handshakes stay bounded by the
+    # pool size even with concurrent requests
+    adapter = TimeoutHTTPAdapter(max_retries=retry, pool_connections=1, pool_maxsize=32, pool_block=True)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+
+def parse_json(resp: requests.Response):
+    # an error response has no json body worth parsing, the failed request
+    # tells more than the decode error would
+    if not resp.ok:
+        raise DependencyTrackError(f"{resp.request.method} {resp.url} returned {resp.status_code}")
+    # orjson parses the large listings considerably faster than the stdlib
+    # json module used by requests, but it is not required
+    if HAS_ORJSON:
+        return orjson.loads(resp.content)
+    return resp.json()
+
+
+def run_concurrently(func, items: list) -> list:
+    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+        return list(executor.map(func, items))
+
+
+def submit_in_parallel(*funcs) -> list:
+    # the executor waits for every function before it returns, so one that
+    # fails does not cut the others short
+    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+        return [executor.submit(func) for func in funcs]
+
+
+def run_in_parallel(*funcs) -> list:
+    return [future.result() for future in submit_in_parallel(*funcs)]
+
+
+def collect_changes(result: dict, futures: list):
+    # the changes of the phases that finished are reported even if another
+    # phase failed, its error is raised afterwards
+    result['changed'] = result['changed'] or any(future.result() for future in futures if future.exception() is None)
+    for future in futures:
+        if future.exception() is not None:
+            raise future.exception()
+
+
+def create_oidc_groups(session: requests.Session, url: str, oidc_groups: list, existing_oidc_groups: dict) -> bool:
+    oidc_group_url = f"{url}/api/v1/oidc/group"
+
+    def create_oidc_group(group: str):
         payload = {'name': group}
-        resp = requests.put(f"{url}/api/v1/oidc/group", json=payload, headers=headers)
+        resp = session.put(oidc_group_url, json=payload)
         if resp.status_code == 201:
+            return parse_json(resp)['uuid']
+        return None
+
+    groups = list(dict.fromkeys(group for group in oidc_groups if group not in existing_oidc_groups))
+    changed = False
+    rejected = []
+    for group, group_uuid in zip(groups, run_concurrently(create_oidc_group, groups)):
+        if group_uuid is not None:
             changed = True
+            existing_oidc_groups[group] = group_uuid
+        else:
+            rejected.append(group)
+
+    # a rejected group may have been created meanwhile, its uuid is needed
+    # for the mappings, so the groups are read again
+    if rejected:
+        current_oidc_groups = get_existing_oidc_groups(session, url)
+        for group in rejected:
+            if group not in current_oidc_groups:
+                raise DependencyTrackError(f"Failed to create oidc group {group}")
+            existing_oidc_groups[group] = current_oidc_groups[group]
     return changed
 
 
-def delete_oidc_groups(url: str, api_key: str, oidc_groups: list) -> bool:
-    headers = {'X-API-Key': api_key}
-    existing_oidc_groups = get_existing_oidc_groups(url, api_key)
-    changed = False
-    for group in oidc_groups:
-        if group not in existing_oidc_groups.keys():
-            continue
+def delete_oidc_groups(session: requests.Session, url: str, oidc_groups: list, existing_oidc_groups: dict) -> bool:
+    oidc_group_url = f"{url}/api/v1/oidc/group/"
+
+    def delete_oidc_group(group: str) -> bool:
         payload = {'name': group}
-        resp = requests.delete(f"{url}/api/v1/oidc/group/{existing_oidc_groups[group]}", json=payload, headers=headers)
-        if resp.status_code == 200:
-            changed = True
-    return changed
+        resp = session.delete(oidc_group_url + existing_oidc_groups[group], json=payload)
+        return resp.status_code == 200
+
+    return any(run_concurrently(delete_oidc_group, [group for group in oidc_groups if group in existing_oidc_groups]))
 
 
 # TODO validate that there was no parallel collision
-def create_teams(url: str, api_key: str, teams: list):
-    existing_teams = list(get_existing_teams(url, api_key).keys())
-    headers = {'X-API-Key': api_key}
-    changed = False
-    for team in teams:
-        team_name = team['name']
-        if team_name in existing_teams:
-            continue
+def create_teams(session: requests.Session, url: str, teams: list, existing_teams: dict):
+    team_url = f"{url}/api/v1/team"
+
+    def create_team(team_name: str):
         payload = {'name': team_name}
-        resp = requests.put(f"{url}/api/v1/team", json=payload, headers=headers)
+        resp = session.put(team_url, json=payload)
         if resp.status_code == 201:
+            return parse_json(resp)
+        elif resp.status_code != 409:
+            raise DependencyTrackError(f"Failed to create team {team_name}: {resp.status_code} {resp.text}")
+        return None
+
+    # dependency track allows several teams with the same name, so every
+    # name is only sent once
+    team_names = list(dict.fromkeys(team['name'] for team in teams if team['name'] not in existing_teams))
+    changed = False
+    conflicts = []
+    for team_name, created_team in zip(team_names, run_concurrently(create_team, team_names)):
+        if created_team is not None:
             changed = True
-            existing_teams.append(team_name)
+            existing_teams[team_name] = created_team
+        else:
+            conflicts.append(team_name)
+
+    # a conflicting team was created meanwhile, the mappings need its uuid,
+    # so the teams are read again
+    if conflicts:
+        current_teams = get_existing_teams(session, url)
+        for team_name in conflicts:
+            if team_name not in current_teams:
+                raise DependencyTrackError(f"Failed to create team {team_name}: conflict with an unknown team")
+            existing_teams[team_name] = current_teams[team_name]
     return changed
 
 
-def delete_teams(url: str, api_key: str, teams: list):
-    existing_teams = get_existing_teams(url, api_key)
-    headers = {'X-API-Key': api_key}
-    changed = False
-    for team in teams:
-        team_name = team['name']
-        if team_name not in existing_teams.keys():
-            continue
-        payload = {'uuid': existing_teams[team_name]}
-        resp = requests.delete(f"{url}/api/v1/team", json=payload, headers=headers)
-        if resp.status_code == 200:
-            changed = True
-    return changed
+def delete_teams(session: requests.Session, url: str, teams: list, existing_teams: dict):
+    team_url = f"{url}/api/v1/team"
 
+    def delete_team(team_name: str) -> bool:
+        payload = {'uuid': existing_teams[team_name]['uuid']}
+        resp = session.delete(team_url, json=payload)
+        return resp.status_code == 200
 
-def create_projects(url: str, api_key: str, projects: dict) -> bool:
-    existing_project_tree = flatten_project_tree(get_project_tree(url, api_key))
-    headers = {'X-API-Key': api_key}
-    changed = False
-    for project in projects:
-        if project['name'] in existing_project_tree.keys():
-            continue
-        if project['parent'] is not None and project['parent'] not in existing_project_tree.keys():
-            continue
+    return any(run_concurrently(delete_team, [team['name'] for team in teams if team['name'] in existing_teams]))
 
-        parent = project['parent']
-        if parent is not None and parent in existing_project_tree.keys():
-            parent = {'uuid': existing_project_tree[parent]}
+
+def create_projects(session: requests.Session, url: str, projects: dict, project_index: ProjectIndex) -> bool:
+    project_ids = project_index.uuids
+    project_url = f"{url}/api/v1/project"
+
+    def create_project(project: dict):
+        parent_uuid = project_ids.get(project['parent'])
+        parent = {'uuid': parent_uuid} if parent_uuid is not None else None
 
         payload = {'name': project['name'], 'parent': parent, 'classifier': project['classifier'], 'tags': [], 'active': True}
-        resp = requests.put(f"{url}/api/v1/project", json=payload, headers=headers)
+        resp = session.put(project_url, json=payload)
         if resp.status_code == 201:
+            return parse_json(resp)
+        return None
+
+    # the projects are created level by level, all projects whose parent
+    # already exists are created concurrently
+    changed = False
+    pending = [project for project in projects if project['name'] not in project_ids]
+    while pending:
+        level = []
+        waiting = []
+        for project in pending:
+            if project['parent'] is None or project['parent'] in project_ids:
+                level.append(project)
+            else:
+                waiting.append(project)
+        if not level:
+            break
+        pending = waiting
+
+        for project, response_body in zip(level, run_concurrently(create_project, level)):
+            if response_body is None:
+                continue
             changed = True
-            response_body = resp.json()
-            existing_project_tree[response_body['name']] = response_body['uuid']
+            # keep the tree up to date, so it needs not be fetched again
+            project_ids[response_body['name']] = response_body['uuid']
+            project_index.children[response_body['uuid']] = []
+            parent_uuid = project_ids.get(project['parent'])
+            project_index.parents[response_body['uuid']] = parent_uuid
+            if parent_uuid is not None:
+                project_index.children[parent_uuid].append(response_body['uuid'])
 
     return changed
 
 
-def delete_projects(url: str, api_key: str, projects: list) -> bool:
-    existing_project_tree = flatten_project_tree(get_project_tree(url, api_key))
-    headers = {'X-API-Key': api_key}
-    for project in projects:
-        if project['name'] not in existing_project_tree.keys():
-            continue
-        requests.delete(f"{url}/api/v1/project/{existing_project_tree[project['name']]}", headers=headers)
-    return False
+def delete_projects(session: requests.Session, url: str, projects: list, project_index: ProjectIndex) -> bool:
+    project_url = f"{url}/api/v1/project/"
 
+    def delete_project(project_name: str):
+        session.delete(project_url + project_index.uuids[project_name])
 
-def manage_group_mappings(url: str, api_key: str, teams: dict):
-    existing_teams = get_existing_teams(url, api_key)
-    changed = False
-    existing_project_tree = get_project_tree(url, api_key)
-    for team in teams:
-        group_change = manage_oidc_groups(url, api_key, existing_teams[team['name']], team['oidc_groups'])
-        permission_change = manage_permissions(url, api_key, existing_teams[team['name']], team['permissions'])
-        activate_portfolio_access_control(url, api_key)
-        portfolio_access_control_change = manage_portfolio_access_control(url, api_key, existing_project_tree, existing_teams[team['name']], team['portfolio_access_control'])
-        changed = changed or group_change or permission_change or portfolio_access_control_change
-    return changed
+    run_concurrently(delete_project, [project['name'] for project in projects if project['name'] in project_index.uuids])
+    return False
 
 
-def manage_oidc_groups(url: str, api_key: str, team_uuid: str, team_oidc_groups: list) -> bool:
-    existing_oidc_groups = get_existing_oidc_groups(url, api_key)
-    url = f"{url}/api/v1/oidc/mapping"
-    headers = {'X-API-Key': api_key}
+def manage_group_mappings(session: requests.Session, url: str, teams: dict, existing_teams: dict, existing_oidc_groups: dict, project_index: ProjectIndex):
     changed = False
-    for existing_group_name, existing_group_uuid in existing_oidc_groups.items():
+    if teams:
+        changed = activate_portfolio_access_control(session, url)
+    project_ancestors = build_project_ancestors(project_index)
+
+    def manage_team(team: dict) -> bool:
+        existing_team = existing_teams[team['name']]
+        team_uuid = existing_team['uuid']
+        existing_permissions = {permission['name'] for permission in existing_team.get('permissions', [])}
+        group_change = manage_oidc_groups(session, url, team_uuid, team['oidc_groups'], existing_oidc_groups)
+        permission_change = manage_permissions(session, url, team_uuid, team['permissions'], existing_permissions)
+        portfolio_access_control_change = manage_portfolio_access_control(session, url, project_index.uuids, project_ancestors, team_uuid, team['portfolio_access_control'])
+        return group_change or permission_change or portfolio_access_control_change
+
+    # the teams do not share any mappings, so they are handled concurrently
+    team_changes = run_concurrently(manage_team, teams)
+    return changed or any(team_changes)
+
+
+def manage_oidc_groups(session: requests.Session, url: str, team_uuid: str, team_oidc_groups: list, existing_oidc_groups: dict) -> bool:
+    oidc_mapping_url = f"{url}/api/v1/oidc/mapping"
+    team_oidc_groups = set(team_oidc_groups)
+
+    def manage_oidc_group(existing_group: tuple) -> bool:
+        existing_group_name, existing_group_uuid = existing_group
         if existing_group_name in team_oidc_groups:
             payload = {'group': existing_group_uuid, 'team': team_uuid}
-            resp = requests.put(url, json=payload, headers=headers)
-            if resp.status_code == 200:
-                changed = True
+            resp = session.put(oidc_mapping_url, json=payload)
         else:
-            resp = requests.delete(f"{url}/{existing_group_uuid}", headers=headers)
-            if resp.status_code == 200:
-                changed = True
-    return changed
+            resp = session.delete(f"{oidc_mapping_url}/{existing_group_uuid}")
+        return resp.status_code == 200
 
+    return any(run_concurrently(manage_oidc_group, list(existing_oidc_groups.items())))
 
-def manage_permissions(url, api_key, team_uuid, team_permissions: list) -> bool:
-    permissions = ['ACCESS_MANAGEMENT', 'BOM_UPLOAD', 'POLICY_MANAGEMENT', 'POLICY_VIOLATION_ANALYSIS',
-                   'PORTFOLIO_MANAGEMENT', 'PROJECT_CREATION_UPLOAD', 'SYSTEM_CONFIGURATION', 'VIEW_PORTFOLIO',
-                   'VIEW_VULNERABILITY', 'VULNERABILITY_MANAGEMENT']
-    headers = {'X-API-Key': api_key}
-    changed = False
-    for permission in permissions:
-        if permission not in team_permissions:
-            continue
-        resp = requests.post(f"{url}/api/v1/permission/{permission}/team/{team_uuid}", headers=headers)
-        if resp.status_code == 200:
-            changed = True
-    return changed
 
+def manage_permissions(session: requests.Session, url, team_uuid, team_permissions: list, existing_permissions: set) -> bool:
+    permission_url = f"{url}/api/v1/permission/"
+    team_path = f"/team/{team_uuid}"
+
+    def add_permission(permission: str) -> bool:
+        resp = session.post(permission_url + permission + team_path)
+        return resp.status_code == 200
+
+    # only the requested permissions the team does not have yet need a
+    # request, duplicates are sent once
+    return any(run_concurrently(add_permission, sorted(PERMISSIONS.intersection(team_permissions) - existing_permissions)))
 
-def manage_portfolio_access_control(url: str, api_key: str, existing_project_tree: dir, team_uuid: str, team_portfolio_access_control: dict) -> bool:
+
+def manage_portfolio_access_control(session: requests.Session, url: str, project_ids: dict, project_ancestors: dict, team_uuid: str, team_portfolio_access_control: dict) -> bool:
     projects = team_portfolio_access_control['projects']
-    if team_portfolio_access_control['verify']['enabled']:
-        projects = filter_project_list(existing_project_tree, team_portfolio_access_control['verify']['root_project'], team_portfolio_access_control['projects'])
+    if projects and team_portfolio_access_control['verify']['enabled']:
+        projects = filter_project_list(project_ids, project_ancestors, team_portfolio_access_control['verify']['root_project'], team_portfolio_access_control['projects'])
 
-    return update_portfolio_access_control(url, api_key, existing_project_tree, team_uuid, team_portfolio_access_control['verify'], projects)
+    return update_portfolio_access_control(session, url, project_ids, team_uuid, team_portfolio_access_control['verify'], projects)
 
 
-def update_portfolio_access_control(url: str, api_key: str, existing_project_tree: dir, team_uuid: str, team_portfolio_access_control_verify: dict, projects: list) -> bool:
-    headers = {'X-API-Key': api_key}
-    changed = False
+def update_portfolio_access_control(session: requests.Session, url: str, project_ids: dict, team_uuid: str, team_portfolio_access_control_verify: dict, projects: list) -> bool:
+    acl_mapping_url = f"{url}/api/v1/acl/mapping"
+    team_acl_mapping_url = f"{acl_mapping_url}/team/{team_uuid}/project/"
 
-    for key in existing_project_tree.keys():
-        if key in projects:
-            payload = {'team': team_uuid, 'project': existing_project_tree[key][DICT_KEY_ID]}
-            resp = requests.put(f"{url}/api/v1/acl/mapping", json=payload, headers=headers)
-            if resp.status_code == 200:
-                changed = True
-        else:
-            resp = requests.delete(f"{url}/api/v1/acl/mapping/team/{team_uuid}/project/{existing_project_tree[key][DICT_KEY_ID]}", headers=headers)
-            # TODO verify status (guess: always 200)
-            # if resp.status_code == 200:
-            #     changed = True
-        child_changed = update_portfolio_access_control(url, api_key, existing_project_tree[key][DICT_KEY_CHILDREN], team_uuid, team_portfolio_access_control_verify, projects)
-        changed = changed or child_changed
-    return changed
+    def add_mapping(project_uuid: str):
+        payload = {'team': team_uuid, 'project': project_uuid}
+        session.put(acl_mapping_url, json=payload)
+
+    def delete_mapping(project_uuid: str):
+        session.delete(team_acl_mapping_url + project_uuid)
 
+    # only send the difference to the current mappings of the team, instead
+    # of a put or delete for every project of the portfolio
+    existing_mappings = get_existing_acl_mappings(session, url, team_uuid)
+    mappings = {project_ids[project] for project in projects if project in project_ids}
+    to_add = mappings - existing_mappings
+    to_remove = existing_mappings - mappings
+    if not to_add and not to_remove:
+        return False
+    run_concurrently(add_mapping, list(to_add))
+    run_concurrently(delete_mapping, list(to_remove))
+    # the diff against the current mappings is exactly what changed, also
+    # for the deletions whose response status is not conclusive
+    return True
+
+
+def filter_project_list(project_ids: dict, project_ancestors: dict, team_name: str, projects: list) -> list:
+    if team_name not in project_ids:
+        return []
 
-def filter_project_list(existing_project_tree: dict, team_name: str, projects: list) -> list:
-    return [project for project in projects if access_to_project_allowed(existing_project_tree, team_name, project)]
+    root_id = project_ids[team_name]
+    return [project for project in projects
+            if project in project_ids and (project_ids[project] == root_id or root_id in project_ancestors[project_ids[project]])]
 
 
-def activate_portfolio_access_control(url, api_key):
-    headers = {'X-API-Key': api_key}
+def activate_portfolio_access_control(session: requests.Session, url):
+    # reading the config needs SYSTEM_CONFIGURATION, without it the post
+    # below is still tried and only its status is reported
+    resp = session.get(f"{url}/api/v1/configProperty")
+    if resp.status_code == 200:
+        for config_property in parse_json(resp):
+            if config_property['groupName'] == 'access-management' and config_property['propertyName'] == 'acl.enabled':
+                if config_property.get('propertyValue') == 'true':
+                    return False
+
     payload = [{"groupName": "access-management", "propertyName": "acl.enabled", "propertyValue": "true"}]
-    resp = requests.post(f"{url}/api/v1/configProperty/aggregate", json=payload, headers=headers)
+    resp = session.post(f"{url}/api/v1/configProperty/aggregate", json=payload)
     return resp.status_code == 200
 
 
-def get_existing_teams(url: str, api_key: str) -> dict:
+def get_existing_teams(session: requests.Session, url: str) -> dict:
     url = f"{url}/api/v1/team"
-    headers = {'X-API-Key': api_key}
-    resp = requests.get(url, headers=headers)
+    resp = session.get(url)
 
-    name_to_id_mapping = {}
-    for team in resp.json():
-        name_to_id_mapping[team['name']] = team['uuid']
-    return name_to_id_mapping
+    # the whole team is kept, so the uuids and the api keys are read from
+    # the same response
+    name_to_team_mapping = {}
+    for team in parse_json(resp):
+        name_to_team_mapping[team['name']] = team
+    return name_to_team_mapping
 
 
-def get_team_api_keys(url: str, api_key: str, teams: list) -> dict:
-    url = f"{url}/api/v1/team"
-    headers = {'X-API-Key': api_key}
-    resp = requests.get(url, headers=headers)
-
-    team_names = [team['name'] for team in teams]
-    return {team['name']: team['apiKeys'] for team in resp.json() if team['name'] in team_names}
+def get_team_api_keys(teams: list, existing_teams: dict) -> dict:
+    team_names = {team['name'] for team in teams}
+    return {name: team.get('apiKeys', []) for name, team in existing_teams.items() if name in team_names}
 
 
-def get_existing_oidc_groups(url: str, api_key: str):
+def get_existing_oidc_groups(session: requests.Session, url: str):
     url = f"{url}/api/v1/oidc/group"
-    headers = {'X-API-Key': api_key}
-    resp = requests.get(url, headers=headers)
+    resp = session.get(url)
 
     name_to_id_mapping = {}
-    for group in resp.json():
+    for group in parse_json(resp):
         name_to_id_mapping[group['name']] = group['uuid']
     return name_to_id_mapping
 
 
-def get_existing_project(url: str, api_key: str):
-    url = f"{url}/api/v1/project"
-    headers = {'X-API-Key': api_key}
-    resp = requests.get(url, headers=headers)
-
-    name_to_id_mapping = {}
-    for project in resp.json():
-        name_to_id_mapping[project['name']] = project['uuid']
-    return name_to_id_mapping
-
-
-def tree():
-    return defaultdict(tree)
-
+def get_existing_acl_mappings(session: requests.Session, url: str, team_uuid: str) -> set:
+    url = f"{url}/api/v1/acl/team/{team_uuid}"
+    resp = session.get(url)
 
-def access_to_project_allowed(project_tree: dict, team_name: str, project_name: str) -> bool:
-    if team_name not in project_tree.keys():
-        # raise Exception(json.dumps(project_tree))
-        return False
+    return {project['uuid'] for project in parse_json(resp)}
 
-    if team_name == project_name:
-        return True
 
-    return verify_access_control_in_project_tree(project_tree[team_name][DICT_KEY_CHILDREN], project_name)
-
-
-def verify_access_control_in_project_tree(project_tree: dict, project_name: str) -> bool:
-    access_allowed = False
-    for key in project_tree.keys():
-        if project_name == key:
-            access_allowed = True
-        else:
-            child_access_allowed = verify_access_control_in_project_tree(project_tree[key][DICT_KEY_CHILDREN], project_name)
-            access_allowed = access_allowed or child_access_allowed
-    return access_allowed
-
-
-def get_project_tree(url: str, api_key: str) -> dict:
-    project_root_url = f"{url}/api/v1/project?onlyRoot=true"
-    headers = {'X-API-Key': api_key}
-    resp = requests.get(project_root_url, headers=headers)
-
-    project_tree = tree()
-    for project in resp.json():
-        project_tree[project['name']][DICT_KEY_ID] = project['uuid']
-        if 'children' not in project.keys():
-            continue
-        for child in project['children']:
-            project_tree[project['name']][DICT_KEY_CHILDREN][child['name']][DICT_KEY_ID] = child['uuid']
-
-    return add_children_to_project_tree(url, api_key, project_tree)
-
-
-def add_children_to_project_tree(url: str, api_key: str, project_tree: dict) -> dict:
-    for k in project_tree.keys():
-        if not isinstance(project_tree[k], dict):
-            continue
-        if DICT_KEY_CHILDREN in project_tree[k].keys():
-            add_children_to_project_tree(url, api_key, project_tree[k][DICT_KEY_CHILDREN])
-        if DICT_KEY_ID in project_tree[k].keys():
-            children = get_children_of_project(url, api_key, project_tree[k][DICT_KEY_ID])
-            for name, uuid in children.items():
-                project_tree[k][DICT_KEY_CHILDREN][name][DICT_KEY_ID] = uuid
-            add_children_to_project_tree(url, api_key, project_tree[k][DICT_KEY_CHILDREN])
-    return project_tree
-
-
-def get_children_of_project(url: str, api_key: str, project_id: str) -> dict:
-    url = f"{url}/api/v1/project/{project_id}"
-    headers = {'X-API-Key': api_key}
-    resp = requests.get(url, headers=headers)
-
-    project = resp.json()
-    if 'children' not in project.keys():
-        return {}
+def get_existing_project(session: requests.Session, url: str):
+    url = f"{url}/api/v1/project"
+    resp = session.get(url)
 
     name_to_id_mapping = {}
-    for child in project['children']:
-        name_to_id_mapping[child['name']] = child['uuid']
+    for project in parse_json(resp):
+        name_to_id_mapping[project['name']] = project['uuid']
     return name_to_id_mapping
 
 
-def flatten_project_tree(project_tree: dict) -> dict:
-    flatten = defaultdict()
-    for key in project_tree.keys():
-        flatten[key] = project_tree[key][DICT_KEY_ID]
-        child_flatten = flatten_project_tree(project_tree[key][DICT_KEY_CHILDREN])
-        flatten = flatten | child_flatten
-    return flatten
+def build_project_ancestors(project_index: ProjectIndex) -> dict:
+    # maps every project uuid to the uuids of all its ancestors, built with a
+    # single walk of the tree and shared by all teams. a project whose parent
+    # is not listed, e.g. hidden by the portfolio acl, is walked as a root
+    project_ancestors = {}
+    stack = [(project_id, frozenset()) for project_id, parent_id in project_index.parents.items()
+             if parent_id is None or parent_id not in project_index.parents]
+    while stack:
+        project_id, ancestors = stack.pop()
+        project_ancestors[project_id] = ancestors
+        child_ancestors = ancestors | {project_id}
+        stack.extend((child_id, child_ancestors) for child_id in project_index.children[project_id])
+    return project_ancestors
+
+
+def get_project_tree(session: requests.Session, url: str) -> ProjectIndex:
+    # the whole portfolio is read from the paged project listing and the
+    # tree is assembled locally from the parent references, instead of
+    # requesting the children of every single project
+    project_url = f"{url}/api/v1/project"
+
+    def get_page(page_number: int) -> requests.Response:
+        return session.get(project_url, params={'pageSize': PROJECT_PAGE_SIZE, 'pageNumber': page_number})
+
+    # the total count of the first page tells how many pages there are, so
+    # the remaining pages can be requested concurrently
+    resp = get_page(1)
+    page_count = -(-int(resp.headers.get('X-Total-Count', 0)) // PROJECT_PAGE_SIZE)
+    pages = [parse_json(resp)]
+    pages.extend(parse_json(resp) for resp in run_concurrently(get_page, list(range(2, page_count + 1))))
+    # keep paging if the total count is missing or the portfolio grew meanwhile
+    while len(pages[-1]) == PROJECT_PAGE_SIZE:
+        pages.append(parse_json(get_page(len(pages) + 1)))
+
+    project_index = ProjectIndex(uuids={}, children={}, parents={})
+    for page in pages:
+        for project in page:
+            project_index.uuids[project['name']] = project['uuid']
+            project_index.children.setdefault(project['uuid'], [])
+            parent_uuid = project['parent']['uuid'] if project.get('parent') is not None else None
+            project_index.parents[project['uuid']] = parent_uuid
+            if parent_uuid is not None:
+                project_index.children.setdefault(parent_uuid, []).append(project['uuid'])
+
+    return project_index
 
 
 def main():